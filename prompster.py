@@ -10,10 +10,24 @@ Source: https://github.com/IsaacLoop/prompster
 
 import os
 import re
+import sys
+import base64
+import bisect
+import stat
 import fnmatch
-import mimetypes
+import functools
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string
+
+try:
+    import orjson  # optional: faster JSON for large listings
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
 app = Flask(__name__)
 
@@ -21,6 +35,8 @@ app = Flask(__name__)
 # Configuration / constants
 # -------------------------------------------------------
 ROOT = Path(os.getenv("PROMPSTER_ROOT", Path.cwd())).resolve()
+# String prefix for cheap "inside ROOT" checks on already-real paths
+ROOT_STR = str(ROOT) if str(ROOT).endswith(os.sep) else str(ROOT) + os.sep
 
 IGNORE_DEFAULTS = [
     ".git/",
@@ -42,17 +58,27 @@ IGNORE_DEFAULTS = [
 ]
 
 PROMPSTER_IGNORE_FILE = ROOT / ".prompsterignore"
-IGNORE_PATTERNS = IGNORE_DEFAULTS[:]
+_patterns = IGNORE_DEFAULTS[:]
 if PROMPSTER_IGNORE_FILE.exists():
     for line in PROMPSTER_IGNORE_FILE.read_text(
         encoding="utf-8", errors="ignore"
     ).splitlines():
         line = line.strip()
         if line and not line.startswith("#"):
-            IGNORE_PATTERNS.append(line)
+            _patterns.append(line)
+# Read once at import and frozen: the matchers below are derived from it and
+# shared read-only across request threads.
+IGNORE_PATTERNS = tuple(_patterns)
 
 MAX_FILE_BYTES = int(os.getenv("PROMPSTER_MAX_FILE_BYTES", "1048576"))  # 1 MiB
+# Decoded previews kept between /api/copy calls, bounded by total characters
+CONTENT_CACHE_CHARS = int(os.getenv("PROMPSTER_CONTENT_CACHE_CHARS", "67108864"))
 BINARY_SNIFF_BYTES = 4096
+# File reads release the GIL, so /api/copy overlaps them on a shared pool
+IO_POOL = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
+# Bytes that show up in text: printable ASCII, common control chars, and
+# everything >= 0x80 (UTF-8 / legacy encodings). Anything else counts as binary.
+_TEXTCHARS = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F})
 
 EXT_TO_LANG = {
     ".py": "python",
@@ -82,11 +108,27 @@ EXT_TO_LANG = {
 }
 
 
-def detect_language(file_path: str) -> str:
-    _, ext = os.path.splitext(file_path)
+EXT_LEN_MAX = max(len(k) for k in EXT_TO_LANG)
+
+
+@functools.lru_cache(maxsize=64)
+def _lang_for_ext(ext: str) -> str:
+    """Per-extension memo; a repo only has a handful of distinct spellings."""
     return EXT_TO_LANG.get(ext.lower(), "")
 
 
+def detect_language(file_path: str) -> str:
+    i = file_path.rfind(".")
+    # No dot, or a dotfile such as ".bashrc"
+    if i <= 0 or file_path[i - 1] in "/\\":
+        return ""
+    ext = file_path[i:]
+    # Too long to be known, or the dot belongs to a directory name
+    if len(ext) > EXT_LEN_MAX or "/" in ext or "\\" in ext:
+        return ""
+    return _lang_for_ext(ext)
+
+
 def _is_relative_to(path: Path, parent: Path) -> bool:
     try:
         path.relative_to(parent)
@@ -95,135 +137,278 @@ def _is_relative_to(path: Path, parent: Path) -> bool:
         return False
 
 
+def _compile_globs(patterns: list[str]) -> re.Pattern | None:
+    """Fold glob patterns into one regex (None if there are none)."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+# Like gitignore, a pattern without a slash matches the basename at any
+# depth; one with a slash matches the whole ROOT-relative path. Plain names
+# (".git/", "node_modules/", ".DS_Store") skip the regex via a set lookup.
+_GLOB_CHARS = "*?["
+_dir_pats = [p[:-1] for p in IGNORE_PATTERNS if p.endswith("/")]
+_file_pats = [p for p in IGNORE_PATTERNS if not p.endswith("/")]
+LITERAL_DIR_NAMES = frozenset(
+    p for p in _dir_pats if "/" not in p and not any(c in p for c in _GLOB_CHARS)
+)
+LITERAL_FILE_NAMES = frozenset(
+    p for p in _file_pats if "/" not in p and not any(c in p for c in _GLOB_CHARS)
+)
+# File patterns also apply to directories, so each kind gets one name regex
+# and one path regex: at most two matches per entry after the set lookup.
+_file_name_globs = [
+    p for p in _file_pats if "/" not in p and p not in LITERAL_FILE_NAMES
+]
+_file_path_globs = [p for p in _file_pats if "/" in p]
+FILE_NAME_RE = _compile_globs(_file_name_globs)
+FILE_PATH_RE = _compile_globs(_file_path_globs)
+DIR_NAME_RE = _compile_globs(
+    [p for p in _dir_pats if "/" not in p and p not in LITERAL_DIR_NAMES]
+    + _file_name_globs
+)
+DIR_PATH_RE = _compile_globs([p for p in _dir_pats if "/" in p] + _file_path_globs)
+
+
+def _ignored_name(name: str, is_dir: bool) -> bool:
+    """O(1) check of a basename against the literal ignore names."""
+    return name in LITERAL_FILE_NAMES or (is_dir and name in LITERAL_DIR_NAMES)
+
+
 def _ignored(rel_posix: str, is_dir: bool) -> bool:
     """Gitignore-like light matcher with directory-aware patterns."""
-    for pat in IGNORE_PATTERNS:
-        if pat.endswith("/"):
-            if is_dir and fnmatch.fnmatch(rel_posix + "/", pat):
-                return True
-        else:
-            if fnmatch.fnmatch(rel_posix, pat):
-                return True
-    return False
+    name = rel_posix.rpartition("/")[2]
+    if _ignored_name(name, is_dir):
+        return True
+    if is_dir:
+        name_re, path_re = DIR_NAME_RE, DIR_PATH_RE
+    else:
+        name_re, path_re = FILE_NAME_RE, FILE_PATH_RE
+    if name_re and name_re.match(name):
+        return True
+    return bool(path_re and path_re.match(rel_posix))
 
 
-def _children_of(dir_path: Path, offset: int, limit: int):
-    """Return immediate children (no recursion). Paginated."""
-    assert dir_path.is_dir()
-    items = []
-    entries = []
+def _encode_cursor(entry: tuple[bool, str, str, bool, str, int]) -> str:
+    """Opaque keyset cursor for a sorted entry: its (is_file, name)."""
+    raw = f"{int(entry[0])}/{entry[2]}".encode("utf-8", "surrogateescape")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
 
+def _decode_cursor(cursor: str) -> tuple[bool, str, str]:
+    """Inverse of _encode_cursor, as a sort key. Raises ValueError if malformed."""
+    raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+    flag, sep, name = raw.decode("utf-8", "surrogateescape").partition("/")
+    if not sep or flag not in ("0", "1"):
+        raise ValueError("bad cursor")
+    return (flag == "1", name.lower(), name)
+
+
+_STAT_DIR_FD = os.stat in os.supports_dir_fd
+# DirEntry.inode() is free from readdir on Linux (Windows would need a stat);
+# stat'ing in inode order there keeps inode-table reads mostly sequential.
+_INODE_ORDER = sys.platform.startswith("linux")
+
+
+def _lstat_size(dir_path: Path, name: str, dfd: int | None) -> int:
+    """Size of dir_path/name (not following symlinks), 0 if it can't be stat'ed."""
     try:
-        with os.scandir(dir_path) as it:
-            for e in it:
-                try:
-                    isdir = e.is_dir(follow_symlinks=False)
-                except OSError:
-                    continue
-
-                abs_child = Path(e.path).resolve()
-                if not _is_relative_to(abs_child, ROOT):
-                    # Out-of-root symlink or traversal — skip
-                    continue
-
-                rel = abs_child.relative_to(ROOT).as_posix()
-                if _ignored(rel, isdir):
-                    continue
-
-                entries.append((e, isdir, rel, abs_child))
-    except PermissionError:
-        entries = []
-
-    # Sort: directories first, then case-insensitive filename
-    entries.sort(key=lambda t: (not t[1], t[0].name.lower()))
-    total = len(entries)
-    for e, isdir, rel, abs_child in entries[offset : offset + limit]:
-        node = {
-            "name": e.name,
-            "path": rel,
-            "fullPath": str(abs_child),
-            "is_dir": isdir,
-        }
-        if isdir:
-            # Quick probe to check if it has any (non-ignored) children
-            has_children = False
-            try:
-                with os.scandir(e.path) as it2:
-                    for c in it2:
-                        try:
-                            c_isdir = c.is_dir(follow_symlinks=False)
-                        except OSError:
-                            continue
-                        abs_c = Path(c.path).resolve()
-                        if not _is_relative_to(abs_c, ROOT):
-                            continue
-                        rel_c = abs_c.relative_to(ROOT).as_posix()
-                        if _ignored(rel_c, c_isdir):
-                            continue
-                        has_children = True
-                        break
-            except (PermissionError, FileNotFoundError):
-                has_children = False
-            node["hasChildren"] = has_children
-        else:
-            try:
-                node["size"] = e.stat(follow_symlinks=False).st_size
-            except OSError:
-                node["size"] = 0
-        items.append(node)
+        if dfd is not None:
+            return os.stat(name, dir_fd=dfd, follow_symlinks=False).st_size
+        return os.stat(os.path.join(dir_path, name), follow_symlinks=False).st_size
+    except OSError:
+        return 0
+
+
+def _children_of(
+    dir_path: Path,
+    offset: int,
+    limit: int,
+    cursor: str | None = None,
+    st: os.stat_result | None = None,
+) -> dict:
+    """Return immediate children (no recursion). Paginated by offset or cursor."""
+    if st is None:
+        st = os.stat(dir_path)
+    assert stat.S_ISDIR(st.st_mode)
+    # Adding/removing/renaming an entry bumps the dir mtime, which misses
+    # the cache; /api/refresh clears it for everything else.
+    try:
+        entries = _sorted_entries(dir_path, st.st_mtime_ns)
+    except OSError:
+        # Unreadable or vanished since the stat: list it as empty (uncached)
+        entries = ()
+    if cursor:
+        # Resume right after the last entry the client saw
+        offset = bisect.bisect_right(
+            entries, _decode_cursor(cursor), key=itemgetter(0, 1, 2)
+        )
+
+    items = []
+    page = entries[offset : offset + limit]
+    files = [ent for ent in page if not ent[3]]
+    if _INODE_ORDER:
+        files.sort(key=itemgetter(5))
+    # Sizes are stat'ed per page relative to one directory fd, so each
+    # lookup is a single component rather than a walk from /. Folder-only
+    # pages have nothing to stat and skip the open.
+    dfd = None
+    if _STAT_DIR_FD and files:
+        try:
+            dfd = os.open(dir_path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+        except OSError:
+            dfd = None
+    try:
+        sizes = {ent[2]: _lstat_size(dir_path, ent[2], dfd) for ent in files}
+    finally:
+        if dfd is not None:
+            os.close(dfd)
+    for _, _, name, isdir, rel, _ in page:
+        # Compact row [name, path, is_dir, size]; the client expands it and
+        # derives fullPath from its root + path. Directories get no size and
+        # no hasChildren probe: the client shows "(Empty folder)" once an
+        # expand comes back empty.
+        items.append((name, rel, isdir, sizes.get(name)))
 
+    total = len(entries)
+    has_more = (offset + limit) < total
     return {
         "children": items,
         "offset": offset,
         "limit": limit,
         "total": total,
-        "has_more": (offset + limit) < total,
+        "has_more": has_more,
+        "next_cursor": _encode_cursor(page[-1]) if has_more and page else None,
     }
 
 
+@functools.lru_cache(maxsize=1024)
+def _sorted_entries(
+    dir_path: Path, mtime_ns: int
+) -> tuple[tuple[bool, str, str, bool, str, int], ...]:
+    """Scan + filter + sort one directory. Cached per mtime; the result is shared."""
+    # dir_path is already resolved and inside ROOT, so children's relative
+    # paths are built by string concat; only symlinks need resolve().
+    rel_dir = dir_path.relative_to(ROOT).as_posix()
+    if rel_dir == ".":
+        rel_dir = ""
+
+    # Drain the iterator first so the directory fd is closed before the
+    # per-entry work (resolve, ignore matching) runs. Scan errors propagate
+    # so lru_cache doesn't remember a transient failure as an empty folder.
+    with os.scandir(dir_path) as it:
+        scanned = list(it)
+
+    entries = []
+    for e in scanned:
+        try:
+            isdir = e.is_dir(follow_symlinks=False)
+            islink = e.is_symlink()
+        except OSError:
+            continue
+
+        if islink:
+            try:
+                target = Path(e.path).resolve()
+            except (OSError, RuntimeError):
+                # Broken or looping link: skip just this entry
+                continue
+            if not _is_relative_to(target, ROOT):
+                # Out-of-root symlink or traversal — skip
+                continue
+            rel = target.relative_to(ROOT).as_posix()
+        else:
+            rel = f"{rel_dir}/{e.name}" if rel_dir else e.name
+
+        if _ignored(rel, isdir):
+            continue
+
+        # Leading (is_file, lowercase name, name) is the sort key,
+        # computed once; the exact name breaks case-only ties.
+        ino = e.inode() if _INODE_ORDER else 0
+        entries.append((not isdir, e.name.lower(), e.name, isdir, rel, ino))
+
+    # Sort: directories first, then case-insensitive filename. Names are
+    # unique, so plain tuple order never looks past the key fields and no
+    # per-entry key tuple is built.
+    entries.sort()
+    return tuple(entries)
+
+
 def _dynamic_fence(text: str, lang: str) -> str:
     """Use a backtick fence longer than any run inside content."""
+    if "```" not in text:
+        return f"```{lang}\n{text}\n```\n"
+    # Only triple-or-longer runs matter; find() skips straight between them
     longest = 0
-    for m in re.finditer(r"`+", text):
-        longest = max(longest, len(m.group(0)))
-    fence = "`" * max(3, longest + 1)
+    n = len(text)
+    i = text.find("```")
+    while i >= 0:
+        j = i + 3
+        while j < n and text[j] == "`":
+            j += 1
+        longest = max(longest, j - i)
+        i = text.find("```", j)
+    fence = "`" * (longest + 1)
     return f"{fence}{lang}\n{text}\n{fence}\n"
 
 
-def _read_text_sampled(p: Path) -> tuple[str, bool, str | None]:
+def _looks_binary(head: bytes) -> bool:
+    """Git/Perl-style -B heuristic: any NUL, or >30% non-text bytes."""
+    if b"\x00" in head:
+        return True
+    return len(head.translate(None, _TEXTCHARS)) > 0.30 * len(head)
+
+
+# Previews shouldn't bump atime on every preview refresh (Linux only)
+_O_NOATIME = getattr(os, "O_NOATIME", 0)
+
+
+def _read_text_sampled(
+    p: str | Path, size: int | None = None
+) -> tuple[str, bool, str | None]:
     """
     Returns (text, truncated, note).
     - Detects binary quickly.
     - Caps maximum bytes.
+    Pass size when the caller already stat'ed the file.
     """
+    # One open: size via fstat on the same fd. Peek at the head first so
+    # binaries cost one small read, then continue on the same fd.
     try:
-        size = p.stat().st_size
-    except OSError as e:
-        return (f"Error: stat failed: {e}", False, "error")
-
-    # sniff for binary
-    try:
-        with open(p, "rb") as f:
-            head = f.read(BINARY_SNIFF_BYTES)
-    except OSError as e:
-        return (f"Error: open failed: {e}", False, "error")
-
-    if b"\x00" in head:
-        return ("<Binary file omitted>", False, "binary")
-
-    # Bounded read
-    to_read = min(size, MAX_FILE_BYTES)
-    try:
-        with open(p, "rb") as f:
-            data = f.read(to_read)
+        try:
+            fd = os.open(p, os.O_RDONLY | _O_NOATIME)
+        except PermissionError:
+            if not _O_NOATIME:
+                raise
+            # O_NOATIME is only allowed on files we own
+            fd = os.open(p, os.O_RDONLY)
+        with open(fd, "rb", buffering=0) as f:
+            if size is None:
+                size = os.fstat(fd).st_size
+            cap = min(size, MAX_FILE_BYTES)
+            head = bytearray(min(cap, BINARY_SNIFF_BYTES))
+            got = f.readinto(head) or 0
+            if _looks_binary(bytes(head[:got])):
+                return ("<Binary file omitted>", False, "binary")
+            # Unbuffered reads land straight in one preallocated buffer that
+            # is decoded in place: no intermediate bytes copy of the body.
+            # It's sized only now, so rejected binaries never allocate it.
+            buf = memoryview(bytearray(cap))
+            buf[:got] = head[:got]
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while got < len(buf):
+                n = f.readinto(buf[got:])
+                if not n:
+                    break
+                got += n
     except OSError as e:
         return (f"Error: read failed: {e}", False, "error")
 
     truncated = size > MAX_FILE_BYTES
-    try:
-        text = data.decode("utf-8", errors="replace")
-    except Exception:
-        text = data.decode("utf-8", errors="replace")
+    text = str(buf[:got], "utf-8", "replace")  # "replace" never raises
 
     if truncated:
         note = f"<Truncated: {size} bytes > {MAX_FILE_BYTES} byte preview>"
@@ -231,6 +416,68 @@ def _read_text_sampled(p: Path) -> tuple[str, bool, str | None]:
     return (text, truncated, None)
 
 
+# (st_dev, st_ino, st_mtime_ns, st_size) -> _read_text_sampled result, LRU order
+_content_cache: OrderedDict = OrderedDict()
+_content_cache_chars = 0
+_content_lock = threading.Lock()
+
+
+def _read_cached(abs_path: str, st: os.stat_result) -> tuple[str, bool, str | None]:
+    """_read_text_sampled, memoized on file identity + mtime across requests."""
+    global _content_cache_chars
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    with _content_lock:
+        hit = _content_cache.get(key)
+        if hit is not None:
+            _content_cache.move_to_end(key)
+            return hit
+
+    result = _read_text_sampled(abs_path, st.st_size)
+    cost = len(result[0])
+    if result[2] == "error" or cost > CONTENT_CACHE_CHARS:
+        return result
+    with _content_lock:
+        if key not in _content_cache:
+            _content_cache[key] = result
+            _content_cache_chars += cost
+            while _content_cache_chars > CONTENT_CACHE_CHARS:
+                _, old = _content_cache.popitem(last=False)
+                _content_cache_chars -= len(old[0])
+    return result
+
+
+def _clear_content_cache() -> None:
+    """Forget every cached preview (used by /api/refresh)."""
+    global _content_cache_chars
+    with _content_lock:
+        _content_cache.clear()
+        _content_cache_chars = 0
+
+
+def _read_one(raw: str) -> tuple[str, str, str, str | None] | None:
+    """Validate and read one /api/copy entry: (rel, lang, text, note) or None."""
+    # ValueError: embedded NUL. Raised mid-stream it would truncate the reply.
+    try:
+        abs_path = os.path.realpath(raw)
+    except ValueError:
+        return None
+    # Ensure the file is inside ROOT
+    if not abs_path.startswith(ROOT_STR):
+        return None
+    # One stat covers exists + is_file and hands the size to the reader
+    try:
+        st = os.stat(abs_path)
+    except (OSError, ValueError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    rel = abs_path[len(ROOT_STR) :].replace(os.sep, "/")
+    # Previews rebuild on every checkbox toggle, so most files are repeats
+    text, truncated, note = _read_cached(abs_path, st)
+    return (rel, detect_language(rel), text, note)
+
+
 # 3) FRONT-END HTML
 INDEX_HTML = r"""
 <!DOCTYPE html>
@@ -399,20 +646,23 @@ INDEX_HTML = r"""
     'prompster.py'
   ];
   const BLACKLIST_SUFFIXES = ['.egg-info', '.dist-info'];
+  // One case-insensitive regex for "any path segment is a blacklisted name or
+  // ends with a blacklisted suffix", built once instead of per-segment loops.
+  const escapeRe = s => s.replace(/[.*+?^$()|[\]\\]/g, '\\$&');
+  const BLACKLIST_RE = new RegExp(
+    '(?:^|[\\\\/])(?:' + BLACKLIST_NAMES.map(escapeRe).join('|') +
+    '|[^\\\\/]*(?:' + BLACKLIST_SUFFIXES.map(escapeRe).join('|') + '))(?=[\\\\/]|$)',
+    'i'
+  );
   function isBlacklistedPath(fp) {
     if (!fp) return false;
-    const segs = String(fp).split(/[\\/]+/);
-    return segs.some(seg => {
-      const s = seg.toLowerCase();
-      if (BLACKLIST_NAMES.includes(s)) return true;
-      return BLACKLIST_SUFFIXES.some(suf => s.endsWith(suf));
-    });
+    return BLACKLIST_RE.test(String(fp));
   }
 
   let checkMap = {};      // fullPath -> boolean | 'dir'
   let expandMap = {};     // fullPath -> boolean (expanded)
   let allowMap = {};      // fullPath -> boolean (user allowed blacklist override)
-  let treeCache = new Map(); // fullPath -> { children: [...], total, offset }
+  let treeCache = new Map(); // fullPath -> { children: [...], total, cursor }
 
   window.onload = async function() {
     loadLocalMaps();
@@ -447,10 +697,25 @@ INDEX_HTML = r"""
   }
 
   // ---------- API ----------
-  async function fetchChildren(fullPath = "", offset = 0, limit = PAGE_SIZE) {
-    const q = new URLSearchParams({ path: fullPath, offset: String(offset), limit: String(limit) });
+  async function fetchChildren(fullPath = "", cursor = "", limit = PAGE_SIZE) {
+    const params = { path: fullPath, limit: String(limit) };
+    if (cursor) params.cursor = cursor;
+    const q = new URLSearchParams(params);
     const res = await fetch(`/api/tree?${q.toString()}`);
-    return await res.json(); // shape: { parent, children, offset, limit, total, has_more }
+    const data = await res.json(); // shape: { parent, children, offset, limit, total, has_more, next_cursor }
+    if (!fullPath && data.parent) ROOT_FULL_PATH = data.parent.fullPath;
+    // Children arrive as [name, path, is_dir, size] rows with root-relative
+    // paths; expand them and rebuild fullPath here
+    data.children = (data.children || []).map(([name, path, is_dir, size]) => (
+      { name, path, is_dir, size, fullPath: joinRootPath(path) }
+    ));
+    return data;
+  }
+
+  function joinRootPath(rel) {
+    const sep = ROOT_FULL_PATH.includes('\\') && !ROOT_FULL_PATH.includes('/') ? '\\' : '/';
+    const tail = sep === '/' ? rel : rel.split('/').join(sep);
+    return ROOT_FULL_PATH.endsWith(sep) ? ROOT_FULL_PATH + tail : ROOT_FULL_PATH + sep + tail;
   }
 
   // ---------- Rendering ----------
@@ -463,7 +728,7 @@ INDEX_HTML = r"""
     treeDiv.appendChild(ul);
     // cache root
     ROOT_FULL_PATH = data.parent.fullPath;
-    treeCache.set(data.parent.fullPath, { children: data.children, total: data.total, offset: data.children.length });
+    treeCache.set(data.parent.fullPath, { children: data.children, total: data.total, cursor: data.next_cursor });
     if (data.has_more) {
       ul.appendChild(makeLoadMoreRow(data.parent.fullPath, 0));
     }
@@ -473,13 +738,12 @@ INDEX_HTML = r"""
   }
 
   async function renderChildrenInto(containerUL, nodeList, depth) {
-    for (const node of nodeList) {
+    // Folders restored as expanded fetch their children; let those requests
+    // run side by side instead of one after another, then append in order.
+    const rendered = await Promise.all(nodeList.map(node => node.is_dir ? renderFolder(node, depth) : renderFile(node)));
+    nodeList.forEach((node, i) => {
       const li = document.createElement('li');
-      if (node.is_dir) {
-        li.appendChild(await renderFolder(node, depth));
-      } else {
-        li.appendChild(renderFile(node));
-      }
+      li.appendChild(rendered[i]);
       containerUL.appendChild(li);
       // Visual sync: if a folder/file is already selected via checkMap, reflect it
       if (node.is_dir) {
@@ -489,7 +753,7 @@ INDEX_HTML = r"""
         const checkbox = li.querySelector(':scope > input[type="checkbox"]');
         if (checkbox && checkMap[node.fullPath] === true) { checkbox.checked = true; }
       }
-    }
+    });
     // ensure parents reflect children
     document.querySelectorAll('li').forEach(li => updateParentFolders(li));
   }
@@ -556,7 +820,7 @@ INDEX_HTML = r"""
 
     const meta = document.createElement('span');
     meta.classList.add('folder-count');
-    meta.textContent = node.hasChildren ? "" : "(Empty folder)";
+    meta.textContent = "";
 
     header.appendChild(arrow);
     header.appendChild(cb);
@@ -567,8 +831,18 @@ INDEX_HTML = r"""
     content.classList.add('folder-content');
     content.style.display = expanded ? "block" : "none";
 
+    // Emptiness is only known after the first fetch
+    const markIfEmpty = (data) => {
+      if (data.total !== 0) return;
+      arrow.textContent = "";
+      arrow.classList.add('empty');
+      meta.textContent = "(Empty folder)";
+      content.style.display = "none";
+    };
+
     arrow.onclick = async (e) => {
       e.stopPropagation();
+      if (arrow.classList.contains('empty')) return;
       const now = content.style.display !== "none";
       expandMap[node.fullPath] = !now;
       saveExpandMap();
@@ -581,10 +855,11 @@ INDEX_HTML = r"""
           const ul = document.createElement('ul');
           await renderChildrenInto(ul, data.children, depth + 1);
           content.appendChild(ul);
-          treeCache.set(node.fullPath, { children: data.children, total: data.total, offset: data.children.length });
+          treeCache.set(node.fullPath, { children: data.children, total: data.total, cursor: data.next_cursor });
           if (data.has_more) {
             ul.appendChild(makeLoadMoreRow(node.fullPath, depth + 1));
           }
+          markIfEmpty(data);
           fixStickyHeaders();
         }
       } else {
@@ -603,10 +878,11 @@ INDEX_HTML = r"""
       const ul = document.createElement('ul');
       await renderChildrenInto(ul, data.children, depth + 1);
       content.appendChild(ul);
-      treeCache.set(node.fullPath, { children: data.children, total: data.total, offset: data.children.length });
+      treeCache.set(node.fullPath, { children: data.children, total: data.total, cursor: data.next_cursor });
       if (data.has_more) {
         ul.appendChild(makeLoadMoreRow(node.fullPath, depth + 1));
       }
+      markIfEmpty(data);
     }
 
     return folderDiv;
@@ -619,16 +895,14 @@ INDEX_HTML = r"""
     btn.style.marginLeft = "1.6rem";
     btn.onclick = async () => {
       const cache = treeCache.get(folderFullPath);
-      const nextOffset = cache?.offset || 0;
-      const data = await fetchChildren(folderFullPath, nextOffset, PAGE_SIZE);
+      const data = await fetchChildren(folderFullPath, cache?.cursor || "", PAGE_SIZE);
       const parentUL = li.parentElement;
       const insertionPoint = li; // append before the button row
       const fragUL = document.createElement('ul');
       await renderChildrenInto(fragUL, data.children, depth);
       // Move child lis into the real UL
       while (fragUL.firstChild) parentUL.insertBefore(fragUL.firstChild, insertionPoint);
-      const newOffset = nextOffset + data.children.length;
-      treeCache.set(folderFullPath, { children: (cache.children || []).concat(data.children), total: data.total, offset: newOffset });
+      treeCache.set(folderFullPath, { children: (cache?.children || []).concat(data.children), total: data.total, cursor: data.next_cursor });
       if (!data.has_more) li.remove();
       fixStickyHeaders();
     };
@@ -676,12 +950,10 @@ INDEX_HTML = r"""
     const queue = [folderFullPath];
     while (queue.length) {
       const current = queue.shift();
-      let offset = 0;
-      let total = 0;
+      let cursor = "";
       do {
-        const data = await fetchChildren(current, offset, PAGE_SIZE);
-        total = data.total;
-        offset += data.children.length;
+        const data = await fetchChildren(current, cursor, PAGE_SIZE);
+        cursor = data.next_cursor;
         for (const child of data.children) {
           await onChild(child);
           if (child.is_dir) {
@@ -689,7 +961,7 @@ INDEX_HTML = r"""
             if (allowDescend) queue.push(child.fullPath);
           }
         }
-      } while (offset < total);
+      } while (cursor);
     }
   }
 
@@ -735,6 +1007,8 @@ INDEX_HTML = r"""
   async function expandFolderFully(header) {
     const content = header.parentElement.querySelector('.folder-content');
     const arrow = header.querySelector('.folder-arrow');
+    // Known-empty folders ignore clicks and stay hidden; nothing to expand
+    if (arrow?.classList.contains('empty')) return;
     if (content && content.style.display === 'none') {
       arrow.click();
       await waitFor(() => content.style.display !== 'none');
@@ -883,9 +1157,21 @@ INDEX_HTML = r"""
   }
 
   function formatNum(n) { try { return Number(n).toLocaleString(); } catch { return String(n); } }
+  // Same set as the regex \s, checked by char code
+  function isSpaceCode(c) {
+    return (c >= 9 && c <= 13) || c === 32 || c === 0xa0 || c === 0x1680 ||
+      (c >= 0x2000 && c <= 0x200a) || c === 0x2028 || c === 0x2029 ||
+      c === 0x202f || c === 0x205f || c === 0x3000 || c === 0xfeff;
+  }
   function calculateStats(text, fileCount) {
-    const lines = text ? text.split("\n").length : 0;
-    const words = text.trim() ? text.trim().split(/\s+/).filter(Boolean).length : 0;
+    // One pass, no split arrays: count newlines and space->non-space edges
+    let lines = text ? 1 : 0, words = 0, inWord = false;
+    for (let i = 0; i < text.length; i++) {
+      const c = text.charCodeAt(i);
+      if (c === 10) lines++;
+      if (isSpaceCode(c)) inWord = false;
+      else if (!inWord) { inWord = true; words++; }
+    }
     const chars = text.length;
     return `${formatNum(fileCount)} file${fileCount>1?"s":""} | ${formatNum(lines)} line${lines>1?"s":""} | ${formatNum(words)} word${words>1?"s":""} | ${formatNum(chars)} character${chars>1?"s":""} selected`;
   }
@@ -926,6 +1212,7 @@ INDEX_HTML = r"""
         break;
       }
       case 'refreshBtn': {
+        await fetch('/api/refresh', { method: 'POST' });
         treeCache.clear();
         await renderRoot();
         await updatePreview();
@@ -934,7 +1221,7 @@ INDEX_HTML = r"""
       case 'collapseAllBtn': {
         expandMap = {}; saveExpandMap();
         document.querySelectorAll('.folder-content').forEach(c => c.style.display = "none");
-        document.querySelectorAll('.folder .folder-header .folder-arrow').forEach(a => a.textContent = "►");
+        document.querySelectorAll('.folder .folder-header .folder-arrow:not(.empty)').forEach(a => a.textContent = "►");
         break;
       }
       case 'expandAllBtn': {
@@ -985,6 +1272,18 @@ INDEX_HTML = r"""
 # -------------------------------------------------------
 # Flask Routes
 # -------------------------------------------------------
+def _json_response(obj: object) -> Response:
+    """jsonify, via orjson when it's installed. Used for every JSON reply."""
+    if orjson is None:
+        return jsonify(obj)
+    try:
+        body = orjson.dumps(obj)
+    except orjson.JSONEncodeError:
+        # Non-UTF-8 filenames decode to lone surrogates, which orjson rejects
+        return jsonify(obj)
+    return app.response_class(body, mimetype="application/json")
+
+
 @app.route("/")
 def index():
     return render_template_string(INDEX_HTML)
@@ -993,23 +1292,36 @@ def index():
 @app.route("/api/tree")
 def api_tree():
     """
-    Lazy endpoint: returns immediate children of the requested folder.
+    Lazy endpoint: returns immediate children of the requested folder,
+    as [name, path, is_dir, size] rows (size is null for folders).
     Query params:
       - path: relative or absolute folder path (defaults to ROOT)
       - limit: max items (default 500)
       - offset: pagination offset (default 0)
+      - cursor: next_cursor from the previous page; takes precedence over offset
     """
     rel = request.args.get("path", "")
     limit = int(request.args.get("limit", 500))
     offset = int(request.args.get("offset", 0))
+    cursor = request.args.get("cursor") or None
 
     base = (ROOT / rel).resolve() if rel else ROOT
-    if (not base.exists()) or (not base.is_dir()) or (not _is_relative_to(base, ROOT)):
-        return jsonify({"error": "Invalid path"}), 400
+    if not _is_relative_to(base, ROOT):
+        return _json_response({"error": "Invalid path"}), 400
+    # One stat answers exists/is_dir and feeds the listing cache key
+    try:
+        st = os.stat(base)
+    except OSError:
+        return _json_response({"error": "Invalid path"}), 400
+    if not stat.S_ISDIR(st.st_mode):
+        return _json_response({"error": "Invalid path"}), 400
 
-    payload = _children_of(base, offset, limit)
+    try:
+        payload = _children_of(base, offset, limit, cursor, st)
+    except ValueError:
+        return _json_response({"error": "Invalid cursor"}), 400
     # Return a shape that's easy for the client: just list of children + paging
-    return jsonify(
+    resp = _json_response(
         {
             "parent": {
                 "name": base.name or str(ROOT),
@@ -1023,6 +1335,20 @@ def api_tree():
             **payload,
         }
     )
+    # The listing itself is mtime-cached server side; a body-hash ETag with
+    # no-cache makes the browser revalidate, and unchanged pages come back
+    # as an empty 304 that fetch() fills from its cache.
+    resp.add_etag()
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+@app.route("/api/refresh", methods=["POST"])
+def api_refresh():
+    """Drop cached listings and previews so the next requests rescan."""
+    _sorted_entries.cache_clear()
+    _clear_content_cache()
+    return _json_response({"ok": True})
 
 
 @app.route("/api/copy", methods=["POST"])
@@ -1034,29 +1360,29 @@ def api_copy():
     data = request.get_json(force=True, silent=True) or {}
     selected = data.get("files", [])
     if not isinstance(selected, list):
-        return jsonify({"error": "files must be a list"}), 400
-
-    md_pieces = []
-    for raw in selected:
-        p = Path(raw).resolve()
-        # Ensure the file is inside ROOT
-        if not _is_relative_to(p, ROOT) or (not p.exists()) or (not p.is_file()):
-            continue
-
-        rel = p.relative_to(ROOT).as_posix()
-        lang = detect_language(rel)
-
-        text, truncated, note = _read_text_sampled(p)
-        if note == "binary":
-            snippet = f"**{rel}**\n```\n<Binary file omitted>\n```\n\n"
-        elif note == "error":
-            snippet = f"**{rel}**\n```\n{text}\n```\n\n"
-        else:
-            fenced = _dynamic_fence(text, lang)
-            snippet = f"**{rel}**\n{fenced}\n"
-        md_pieces.append(snippet)
-
-    return "".join(md_pieces)
+        return _json_response({"error": "files must be a list"}), 400
+    # Checked up front: once streaming starts, an error can only truncate
+    if not all(isinstance(f, str) for f in selected):
+        return _json_response({"error": "files must be strings"}), 400
+
+    def generate() -> Iterator[str]:
+        # map() keeps the selection order while reads run concurrently; a
+        # single file isn't worth the hand-off to a worker thread
+        mapper = IO_POOL.map if len(selected) > 1 else map
+        for result in mapper(_read_one, selected):
+            if result is None:
+                continue
+            rel, lang, text, note = result
+            if note == "binary":
+                yield f"**{rel}**\n```\n<Binary file omitted>\n```\n\n"
+            elif note == "error":
+                yield f"**{rel}**\n```\n{text}\n```\n\n"
+            else:
+                fenced = _dynamic_fence(text, lang)
+                yield f"**{rel}**\n{fenced}\n"
+
+    # Streamed per file: no joined copy of the whole payload in memory
+    return Response(generate(), mimetype="text/plain")
 
 
 if __name__ == "__main__":